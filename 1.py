@@ -2,6 +2,8 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
+import tracemalloc
+from scipy import sparse
 
 # Set the style for visualizations
 plt.style.use('seaborn-v0_8-whitegrid')
@@ -30,57 +32,319 @@ input_location = int(0.2 * nx)  # location of pollution input (20% of the way do
 input_rate = 2.0  # pollution input rate (mass/day)
 input_duration = int(0.1 * nt)  # duration of input (10% of total simulation time)
 
-def solve_1d_dar(D, v, k, x, t, dx, dt, input_location, input_rate, input_duration):
+# Monitoring stations (same sites as the water quality survey in 2.py)
+station_names = ['Headwaters', 'Station 2', 'Station 3', 'Station 4', 'Station 5', 'Station 6', 'Station 7', 'River Mouth']
+station_distances = [0, 200, 400, 600, 800, 1000, 1200, 1400]
+
+def solve_1d_dar(D, v, k, x, t, dx, dt, input_location, input_rate, input_duration,
+                 compute_dtype=np.float64, storage_dtype=None):
     """
     Solves the 1D Diffusion-Advection-Reaction equation using explicit finite differences.
+    The scheme runs in `compute_dtype` and the stored history uses `storage_dtype`
+    (defaults to `compute_dtype`), e.g. float32 compute with float16 storage.
     """
+    compute_dtype = np.dtype(compute_dtype)
+    storage_dtype = compute_dtype if storage_dtype is None else np.dtype(storage_dtype)
+    nt, nx = len(t), len(x)
+    
     # Initialize concentration array
-    c = np.zeros((nt, nx))
+    c = np.zeros((nt, nx), dtype=storage_dtype)
     
     # Initial condition - clean river (zero concentration everywhere)
     c[0, :] = 0.0
     
-    # Compute stability condition number for finite difference method
-    alpha = D * dt / (dx**2)
-    beta = v * dt / dx
-    
-    if alpha > 0.5 or abs(beta) > 1:
-        print(f"Warning: Numerical instability possible! alpha={alpha}, beta={beta}")
+    # Check the stability condition of the finite difference method
+    problem = stability_problem(D, v, k, dx, dt)
+    if problem:
+        print(f"Warning: Numerical instability possible! {problem}")
         print("Try decreasing dt or increasing dx.")
     
+    # Coefficients in the compute precision so NumPy does not promote back to float64
+    D, v, k, dx, dt = (compute_dtype.type(p) for p in (D, v, k, dx, dt))
+    
+    # Current and next time level are kept in the compute precision; only the
+    # stored history is rounded to the storage precision
+    c_now = np.zeros(nx, dtype=compute_dtype)
+    c_next = np.zeros(nx, dtype=compute_dtype)
+    
     # Solve using explicit finite difference method
     for n in range(0, nt-1):
         # Source term - constant input at a specific location for a set duration
-        source = np.zeros(nx)
+        source = np.zeros(nx, dtype=compute_dtype)
         if n < input_duration:
             source[input_location] = input_rate * dt / dx
         
-        # Update concentration using finite differences
-        for i in range(1, nx-1):
-            # Diffusion term: D * (c[i+1] - 2*c[i] + c[i-1]) / dx²
-            diffusion = D * (c[n, i+1] - 2*c[n, i] + c[n, i-1]) / (dx**2)
-            
-            # Advection term: -v * (c[i] - c[i-1]) / dx (upwind scheme)
-            advection = -v * (c[n, i] - c[n, i-1]) / dx
-            
-            # Reaction term: -k * c[i]
-            reaction = -k * c[n, i]
-            
-            # Update concentration
-            c[n+1, i] = c[n, i] + dt * (diffusion + advection + reaction) + source[i]
+        # Diffusion term: D * (c[i+1] - 2*c[i] + c[i-1]) / dx²
+        diffusion = D * (c_now[2:] - 2*c_now[1:-1] + c_now[:-2]) / (dx**2)
+        
+        # Advection term: -v * (c[i] - c[i-1]) / dx (upwind scheme)
+        advection = -v * (c_now[1:-1] - c_now[:-2]) / dx
+        
+        # Reaction term: -k * c[i]
+        reaction = -k * c_now[1:-1]
+        
+        # Update concentration at the interior points
+        c_next[1:-1] = c_now[1:-1] + dt * (diffusion + advection + reaction) + source[1:-1]
         
         # Boundary conditions
         # Upstream: fixed concentration (clean water entering)
-        c[n+1, 0] = 0.0
+        c_next[0] = 0.0
         
         # Downstream: zero gradient (concentration doesn't change at outlet)
-        c[n+1, -1] = c[n+1, -2]
+        c_next[-1] = c_next[-2]
+        
+        c[n+1, :] = c_next
+        c_now, c_next = c_next, c_now
     
+    check_finite_history(c, compute_dtype, storage_dtype)
+    return c
+
+def stability_problem(D, v, k, dx, dt):
+    """
+    Returns why the explicit upwind scheme is unstable for these parameters, or None.
+    The scheme stays bounded and non-negative when D >= 0, v >= 0 and
+    2*alpha + beta + k*dt <= 1 with alpha = D*dt/dx² and beta = v*dt/dx.
+    D, v and k may be scalars or per-scenario arrays.
+    """
+    D, v, k = (np.asarray(p, dtype=np.float64) for p in (D, v, k))
+    if np.any(D < 0) or np.any(v < 0):
+        return f"D and v must be non-negative for the upwind scheme (min D={D.min():g}, min v={v.min():g})"
+    
+    number = 2 * D * dt / (dx**2) + v * dt / dx + k * dt
+    if np.any(number > 1 + 1e-12):
+        return f"2*alpha + beta + k*dt = {number.max():.3g} exceeds 1"
+    return None
+
+def check_finite_history(c, compute_dtype, storage_dtype):
+    """
+    Raises OverflowError if the stored history holds non-finite values, e.g. from
+    overflow in the compute precision or concentrations above 65504 rounded to
+    inf in float16 storage.
+    """
+    if not np.isfinite(c).all():
+        largest = min(np.finfo(compute_dtype).max, np.finfo(storage_dtype).max)
+        raise OverflowError(f"Concentrations are not finite with {compute_dtype.name} compute and "
+                            f"{storage_dtype.name} storage (largest finite value {largest:g}); "
+                            "use wider dtypes or check the scenario's stability.")
+
+def build_source_schedule(sources, x, t, dx, dt):
+    """
+    Converts a list of point sources into a compact schedule of arrays: the grid
+    'cell', the per-step 'increment' (rate*dt/dx) and the active steps
+    'first' <= n < 'stop'. The solver expands it into one source vector per step.
+    Each source is a dict with 'location' (km), 'rate' (mass/day) and the active
+    window 'start'/'end' (days); a step n is active while start <= n*dt < end.
+    Sources must lie on an interior cell, since boundary cells are overwritten
+    by the boundary conditions.
+    """
+    steps = np.arange(len(t) - 1) * dt
+    schedule = {
+        'cell': np.zeros(len(sources), dtype=np.intp),
+        'increment': np.zeros(len(sources)),
+        'first': np.zeros(len(sources), dtype=np.intp),
+        'stop': np.zeros(len(sources), dtype=np.intp),
+    }
+    
+    for i, source in enumerate(sources):
+        start = source.get('start', 0.0)
+        if source['end'] < start:
+            raise ValueError(f"Source ends before it starts: start={start}, end={source['end']}")
+        if not x[0] < source['location'] < x[-1]:
+            raise ValueError(f"Source location {source['location']} lies outside the river ({x[0]}, {x[-1]}).")
+        cell = int(np.argmin(np.abs(x - source['location'])))
+        if cell == 0 or cell == len(x) - 1:
+            raise ValueError(f"Source location {source['location']} is nearest to a boundary cell.")
+        
+        schedule['cell'][i] = cell
+        schedule['increment'][i] = source['rate'] * dt / dx
+        schedule['first'][i] = np.searchsorted(steps, start, side='left')
+        schedule['stop'][i] = np.searchsorted(steps, source['end'], side='left')
+    
+    return schedule
+
+def solve_1d_dar_batch(D, v, k, x, t, dx, dt, schedules, compute_dtype=np.float64, storage_dtype=None):
+    """
+    Solves the 1D Diffusion-Advection-Reaction equation for a batch of scenarios that
+    share a grid, using the same explicit scheme as solve_1d_dar vectorised over
+    space and scenarios. D, v and k are scalars or arrays of shape (members,);
+    `schedules` holds one build_source_schedule result per member, expanded into
+    a single (members, nx) source vector per step.
+    `compute_dtype` and `storage_dtype` behave as in solve_1d_dar.
+    """
+    compute_dtype = np.dtype(compute_dtype)
+    storage_dtype = compute_dtype if storage_dtype is None else np.dtype(storage_dtype)
+    
+    members, steps, cells = len(schedules), len(t) - 1, len(x)
+    D = np.broadcast_to(np.asarray(D, dtype=compute_dtype), (members,))[:, None]
+    v = np.broadcast_to(np.asarray(v, dtype=compute_dtype), (members,))[:, None]
+    k = np.broadcast_to(np.asarray(k, dtype=compute_dtype), (members,))[:, None]
+    
+    # Point sources of all members, flattened once
+    member = np.concatenate([np.full(len(s['cell']), m, dtype=np.intp) for m, s in enumerate(schedules)])
+    cell = np.concatenate([s['cell'] for s in schedules])
+    increment = np.concatenate([s['increment'] for s in schedules]).astype(compute_dtype)
+    first = np.concatenate([s['first'] for s in schedules])
+    stop = np.concatenate([s['stop'] for s in schedules])
+    
+    c = np.zeros((members, steps + 1, cells), dtype=storage_dtype)
+    
+    problem = stability_problem(D, v, k, dx, dt)
+    if problem:
+        print(f"Warning: Numerical instability possible! {problem}")
+        print("Try decreasing dt or increasing dx.")
+    
+    dx, dt = compute_dtype.type(dx), compute_dtype.type(dt)
+    c_now = np.zeros((members, cells), dtype=compute_dtype)
+    c_next = np.zeros((members, cells), dtype=compute_dtype)
+    source = np.zeros((members, cells), dtype=compute_dtype)
+    
+    for n in range(steps):
+        active = (first <= n) & (n < stop)
+        source[:] = 0.0
+        np.add.at(source, (member[active], cell[active]), increment[active])
+        
+        diffusion = D * (c_now[:, 2:] - 2*c_now[:, 1:-1] + c_now[:, :-2]) / (dx**2)
+        advection = -v * (c_now[:, 1:-1] - c_now[:, :-2]) / dx
+        reaction = -k * c_now[:, 1:-1]
+        
+        c_next[:, 1:-1] = c_now[:, 1:-1] + dt * (diffusion + advection + reaction) + source[:, 1:-1]
+        
+        # Same boundary conditions as solve_1d_dar
+        c_next[:, 0] = 0.0
+        c_next[:, -1] = c_next[:, -2]
+        
+        c[:, n+1, :] = c_next
+        c_now, c_next = c_next, c_now
+    
+    check_finite_history(c, compute_dtype, storage_dtype)
     return c
 
 # Solve the DAR equation
 concentration = solve_1d_dar(D, v, k, x, t, dx, dt, input_location, input_rate, input_duration)
 
+def build_station_operator(x, station_distances):
+    """
+    Builds a sparse operator that linearly interpolates grid cells onto station positions.
+    Row j holds the two weights of the grid cells bracketing station j.
+    """
+    x = np.asarray(x, dtype=float)
+    positions = np.asarray(station_distances, dtype=float)
+    
+    if np.any(positions < x[0]) or np.any(positions > x[-1]):
+        raise ValueError("Station positions must lie within the model domain.")
+    
+    # Grid cell immediately upstream of each station
+    left = np.clip(np.searchsorted(x, positions, side='right') - 1, 0, len(x) - 2)
+    right_weight = (positions - x[left]) / (x[left + 1] - x[left])
+    
+    rows = np.repeat(np.arange(len(positions)), 2)
+    cols = np.column_stack([left, left + 1]).ravel()
+    weights = np.column_stack([1.0 - right_weight, right_weight]).ravel()
+    
+    operator = sparse.csr_matrix((weights, (rows, cols)), shape=(len(positions), len(x)))
+    operator.eliminate_zeros()
+    return operator
+
+def sample_stations(concentration, operator):
+    """
+    Samples station values from a single run (nt, nx), an ensemble (members, nt, nx)
+    or any array whose last axis is space, using one sparse matrix product.
+    Returns the same shape with the space axis replaced by stations.
+    """
+    concentration = np.asarray(concentration)
+    flat = concentration.reshape(-1, concentration.shape[-1])
+    series = (operator @ flat.T).T
+    return series.reshape(concentration.shape[:-1] + (operator.shape[0],))
+
+def compare_with_observations(concentration, observations, parameter, x, time_index=-1):
+    """
+    Compares modelled concentrations with observed station values.
+    `observations` is a table with 'station' and 'distance' columns such as
+    `water_quality_df` in 2.py; the model on grid `x` is sampled at those
+    distances at `time_index`. `concentration` is a single run (nt, nx) or an
+    ensemble (members, nt, nx); ensembles get one row per member and station,
+    labelled by a 'member' column.
+    """
+    concentration = np.asarray(concentration)
+    if concentration.ndim not in (2, 3):
+        raise ValueError("Concentration must have shape (nt, nx) or (members, nt, nx).")
+    if concentration.shape[-1] != len(x):
+        raise ValueError("Concentration does not match the grid x.")
+    operator = build_station_operator(x, observations['distance'])
+    modelled = np.atleast_2d(sample_stations(concentration[..., time_index, :], operator))
+    
+    n_stations = operator.shape[0]
+    comparison = pd.DataFrame({
+        'station': np.tile(np.asarray(observations['station']), len(modelled)),
+        'distance': np.tile(np.asarray(observations['distance']), len(modelled)),
+        'modelled': modelled.ravel(),
+        'observed': np.tile(np.asarray(observations[parameter]), len(modelled)),
+    })
+    if concentration.ndim == 3:
+        comparison.insert(0, 'member', np.repeat(np.arange(len(modelled)), n_stations))
+    comparison['residual'] = comparison['modelled'] - comparison['observed']
+    return comparison
+
+# Station time series for the whole run, shape (nt, number of stations)
+station_operator = build_station_operator(x, station_distances)
+station_series = sample_stations(concentration, station_operator)
+
+def total_mass(c, dx):
+    """Pollutant mass in the river at each stored time, accumulated in float64."""
+    return np.sum(c, axis=-1, dtype=np.float64) * dx
+
+def precision_report(compute_dtype=np.float32, storage_dtype=None, tolerance=1e-3, members=1):
+    """
+    Runs the default scenario in reduced precision and compares it with the float64 run.
+    Errors are relative to the peak reference value, so the default tolerance
+    corresponds to the ~3 significant digits used for station reporting.
+    With members > 1 the ensemble path (solve_1d_dar_batch) is measured instead.
+    Peak memory covers the whole solve (history, working buffers and sources),
+    as traced by tracemalloc.
+    """
+    def run(compute, storage):
+        tracemalloc.start()
+        try:
+            if members == 1:
+                result = solve_1d_dar(D, v, k, x, t, dx, dt, input_location, input_rate, input_duration,
+                                      compute_dtype=compute, storage_dtype=storage)
+            else:
+                schedule = build_source_schedule([{'location': x[input_location], 'rate': input_rate,
+                                                   'end': input_duration * dt}], x, t, dx, dt)
+                result = solve_1d_dar_batch(D, v, k, x, t, dx, dt, [schedule] * members,
+                                            compute_dtype=compute, storage_dtype=storage)
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return result, peak_bytes
+    
+    reference, reference_peak = run(np.float64, None)
+    reduced, reduced_peak = run(compute_dtype, storage_dtype)
+    
+    peak = np.abs(reference).max()
+    field_error = np.abs(reduced.astype(np.float64) - reference).max() / peak
+    
+    reference_series = sample_stations(reference, station_operator)
+    reduced_series = sample_stations(reduced, station_operator)
+    station_error = np.abs(reduced_series - reference_series).max() / np.abs(reference_series).max()
+    
+    reference_mass = total_mass(reference, dx)
+    mass_error = np.abs(total_mass(reduced, dx) - reference_mass).max() / np.abs(reference_mass).max()
+    
+    return {
+        'compute_dtype': np.dtype(compute_dtype).name,
+        'storage_dtype': reduced.dtype.name,
+        'members': members,
+        'max_relative_error': float(field_error),
+        'station_max_relative_error': float(station_error),
+        'mass_max_relative_error': float(mass_error),
+        'history_bytes': reduced.nbytes,
+        'peak_memory_bytes': reduced_peak,
+        'reference_peak_memory_bytes': reference_peak,
+        'memory_ratio': reduced_peak / reference_peak,
+        'within_tolerance': bool(max(field_error, station_error, mass_error) <= tolerance),
+    }
+
 # Plot selected time snapshots
 def plot_concentration_snapshots():
     fig, ax = plt.subplots(figsize=(12, 8))
@@ -99,10 +363,7 @@ def plot_concentration_snapshots():
                label='Pollution input site')
     
     # Add station markers from the original dataset
-    stations = ['Headwaters', 'Station 2', 'Station 3', 'Station 4', 'Station 5', 'Station 6', 'Station 7', 'River Mouth']
-    distances = [0, 200, 400, 600, 800, 1000, 1200, 1400]
-    
-    for station, distance in zip(stations, distances):
+    for station, distance in zip(station_names, station_distances):
         ax.axvline(x=distance, color='gray', linestyle=':', alpha=0.3)
         ax.text(distance, ax.get_ylim()[1]*0.95, station, rotation=90, 
                 verticalalignment='top', fontsize=8)
@@ -122,18 +383,13 @@ def plot_concentration_snapshots():
 def plot_concentration_evolution():
     fig, ax = plt.subplots(figsize=(12, 8))
     
-    # Select locations to monitor
-    locations = [0, input_location, int(nx/4), int(nx/2), int(3*nx/4), nx-1]
-    distances = [x[loc] for loc in locations]
-    labels = [f'{dist} km' for dist in distances]
-    colors = ['blue', 'red', 'green', 'orange', 'purple', 'brown']
-    
-    for i, loc in enumerate(locations):
-        ax.plot(t, concentration[:, loc], color=colors[i], linewidth=2, label=labels[i])
+    # Monitoring stations, interpolated from the grid by the station operator
+    for j, (station, distance) in enumerate(zip(station_names, station_distances)):
+        ax.plot(t, station_series[:, j], linewidth=2, label=f'{station} ({distance} km)')
     
     ax.set_xlabel('Time (days)')
     ax.set_ylabel('Pollutant concentration (mass/volume)')
-    ax.set_title('Pollutant concentration over time at different locations', 
+    ax.set_title('Pollutant concentration over time at monitoring stations', 
                 fontsize=16, fontweight='bold')
     ax.legend(loc='upper right')
     ax.grid(True)
@@ -167,11 +423,8 @@ def plot_concentration_heatmap():
                 fontsize=16, fontweight='bold')
     
     # Mark station locations on x-axis
-    stations = ['Headwaters', 'Station 2', 'Station 3', 'Station 4', 'Station 5', 'Station 6', 'Station 7', 'River Mouth']
-    distances = [0, 200, 400, 600, 800, 1000, 1200, 1400]
-    
-    ax.set_xticks(distances)
-    ax.set_xticklabels([s.split(' ')[0] for s in stations], rotation=45)
+    ax.set_xticks(station_distances)
+    ax.set_xticklabels([s.split(' ')[0] for s in station_names], rotation=45)
     
     plt.tight_layout()
     plt.savefig('tobol_pollution_heatmap.png', dpi=300)
@@ -199,10 +452,7 @@ def create_model_dashboard():
     ax1.axvline(x=x[input_location], color='black', linestyle='--', alpha=0.5, 
                label='Pollution input site')
     
-    stations = ['Headwaters', 'Station 2', 'Station 3', 'Station 4', 'Station 5', 'Station 6', 'Station 7', 'River Mouth']
-    distances = [0, 200, 400, 600, 800, 1000, 1200, 1400]
-    
-    for station, distance in zip(stations, distances):
+    for station, distance in zip(station_names, station_distances):
         ax1.axvline(x=distance, color='gray', linestyle=':', alpha=0.3)
         ax1.text(distance, ax1.get_ylim()[1]*0.95, station, rotation=90, 
                 verticalalignment='top', fontsize=8)
@@ -215,17 +465,12 @@ def create_model_dashboard():
     
     # Middle plot: concentration time series
     ax2 = plt.subplot(3, 1, 2)
-    locations = [0, input_location, int(nx/4), int(nx/2), int(3*nx/4), nx-1]
-    distances = [x[loc] for loc in locations]
-    labels = [f'{int(dist)} km' for dist in distances]
-    colors = ['blue', 'red', 'green', 'orange', 'purple', 'brown']
-    
-    for i, loc in enumerate(locations):
-        ax2.plot(t, concentration[:, loc], color=colors[i], linewidth=2, label=labels[i])
+    for j, (station, distance) in enumerate(zip(station_names, station_distances)):
+        ax2.plot(t, station_series[:, j], linewidth=2, label=f'{station} ({distance} km)')
     
     ax2.set_xlabel('Time (days)')
     ax2.set_ylabel('Pollutant concentration')
-    ax2.set_title('B) Pollutant concentration over time at different locations', fontsize=14)
+    ax2.set_title('B) Pollutant concentration over time at monitoring stations', fontsize=14)
     ax2.legend(loc='upper right')
     ax2.grid(True)
     
@@ -244,8 +489,8 @@ def create_model_dashboard():
     ax3.set_ylabel('Time (days)')
     ax3.set_title('C) Spatiotemporal evolution of pollutant concentration', fontsize=14)
     
-    ax3.set_xticks(distances)
-    ax3.set_xticklabels([s.split(' ')[0] for s in stations], rotation=45)
+    ax3.set_xticks(station_distances)
+    ax3.set_xticklabels([s.split(' ')[0] for s in station_names], rotation=45)
     
     plt.tight_layout(rect=[0, 0, 1, 0.96])
     plt.savefig('tobol_pollution_model_dashboard.png', dpi=300)
@@ -6,6 +6,9 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from matplotlib.ticker import MaxNLocator
 import matplotlib.gridspec as gridspec
+import bisect
+import math
+from collections import Counter, deque
 
 # Set the style for all visualizations
 plt.style.use('seaborn-v0_8-whitegrid')
@@ -317,6 +320,391 @@ def plot_historical_trends():
     
     save_figure(fig, 'tobol_historical_trends.png')
 
+# Incremental statistics for continuously appended sensor readings
+class P2Quantile:
+    """
+    Streaming quantile estimate using the P-square algorithm (Jain & Chlamtac, 1985).
+    Keeps five markers, so memory and update cost are constant; tail estimates
+    are less accurate when the series drifts strongly over time.
+    """
+    def __init__(self, p):
+        self.p = p
+        self.heights = []
+        self.positions = [0, 1, 2, 3, 4]
+        self.desired = [0, 2*p, 4*p, 2 + 2*p, 4]
+        self.increments = [0, p/2, p, (1 + p)/2, 1]
+    
+    @classmethod
+    def from_sorted(cls, values, p):
+        """Starts an estimator from an already sorted sample of at least five values."""
+        estimator = cls(p)
+        last = len(values) - 1
+        estimator.desired = [0, last*p/2, last*p, last*(1 + p)/2, last]
+        estimator.positions = [int(round(d)) for d in estimator.desired]
+        estimator.heights = [values[i] for i in estimator.positions]
+        return estimator
+    
+    def copy(self):
+        estimator = P2Quantile(self.p)
+        estimator.heights = list(self.heights)
+        estimator.positions = list(self.positions)
+        estimator.desired = list(self.desired)
+        return estimator
+    
+    def update(self, value):
+        q = self.heights
+        if len(q) < 5:
+            bisect.insort(q, value)
+            return
+        
+        # Find the cell containing the new value and extend the extremes if needed
+        if value < q[0]:
+            q[0] = value
+            cell = 0
+        elif value >= q[4]:
+            q[4] = value
+            cell = 3
+        else:
+            cell = bisect.bisect_right(q, value) - 1
+        
+        n = self.positions
+        for i in range(cell + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+        
+        # Adjust the three middle markers towards their desired positions
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i+1] - n[i] > 1) or (d <= -1 and n[i-1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                parabolic = q[i] + d / (n[i+1] - n[i-1]) * (
+                    (n[i] - n[i-1] + d) * (q[i+1] - q[i]) / (n[i+1] - n[i])
+                    + (n[i+1] - n[i] - d) * (q[i] - q[i-1]) / (n[i] - n[i-1]))
+                if q[i-1] < parabolic < q[i+1]:
+                    q[i] = parabolic
+                else:
+                    q[i] = q[i] + d * (q[i+d] - q[i]) / (n[i+d] - n[i])
+                n[i] += d
+    
+    def value(self):
+        if not self.heights:
+            return np.nan
+        if len(self.heights) < 5:
+            return float(np.quantile(self.heights, self.p))
+        return self.heights[2]
+
+class StreamingSeries:
+    """
+    Running aggregates and trend statistics for one station/parameter series.
+    
+    Readings must arrive in time order. A reading costs O(1) unless it starts a
+    new resampling period; closing the previous period then costs O(number of
+    periods). Trend statistics cover the closed periods plus the still-open
+    latest period, which is included provisionally until it closes.
+    
+    Sen's slope is exact while the pairwise slopes fit in `max_exact_slopes`;
+    beyond that the slopes feed a P-square median sketch, so memory stays bounded.
+    The rolling window is kept as (sum, count) sub-buckets of width `bucket`, so
+    its memory depends on window/bucket rather than on the sampling rate and the
+    window edge has bucket resolution.
+    """
+    def __init__(self, freq='Y', window='365D', quantiles=(0.1, 0.5, 0.9), max_exact_slopes=10000,
+                 bucket='1D'):
+        self.freq = freq
+        self.window = pd.Timedelta(window)
+        self.bucket = pd.Timedelta(bucket)
+        if self.window <= pd.Timedelta(0) or self.bucket <= pd.Timedelta(0):
+            raise ValueError(f"Rolling window and bucket must be positive, got {window!r} and {bucket!r}")
+        self.max_exact_slopes = max_exact_slopes
+        
+        # Overall moments (Welford's algorithm) and quantile sketches
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.quantiles = {p: P2Quantile(p) for p in quantiles}
+        
+        # Rolling window as [bucket start, sum, count] sub-buckets
+        self.recent = deque()
+        self.last_time = None
+        
+        # Resampled series: the open period and the closed periods with their means
+        self.open_period = None
+        self.open_sum = 0.0
+        self.open_count = 0
+        self.periods = []
+        self.period_means = []
+        
+        # Mann-Kendall S statistic and tie counts over closed periods
+        self.sorted_means = []
+        self.ties = Counter()
+        self.mk_s = 0
+        
+        # Pairwise (Sen) slopes over closed periods: a sorted list, then a median sketch
+        self.slopes = []
+        self.slope_sketch = None
+    
+    def update(self, timestamp, value):
+        timestamp = pd.Timestamp(timestamp)
+        value = float(value)
+        if self.last_time is not None and timestamp < self.last_time:
+            raise ValueError(f"Readings must be appended in time order: {timestamp} < {self.last_time}")
+        self.last_time = timestamp
+        
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        for estimator in self.quantiles.values():
+            estimator.update(value)
+        
+        bucket_start = timestamp.floor(self.bucket)
+        if self.recent and self.recent[-1][0] == bucket_start:
+            self.recent[-1][1] += value
+            self.recent[-1][2] += 1
+        else:
+            self.recent.append([bucket_start, value, 1])
+        while self.recent[0][0] + self.bucket <= timestamp - self.window:
+            self.recent.popleft()
+        
+        period = timestamp.to_period(self.freq)
+        if self.open_period is not None and period != self.open_period:
+            self.close_period()
+        self.open_period = period
+        self.open_sum += value
+        self.open_count += 1
+    
+    def rolling_mean(self):
+        """Mean over the rolling window, summed afresh from its buckets."""
+        count = sum(bucket[2] for bucket in self.recent)
+        if count == 0:
+            return np.nan
+        return math.fsum(bucket[1] for bucket in self.recent) / count
+    
+    def new_slopes(self, period, period_mean):
+        """Slopes from every closed period to `period`, per elapsed period."""
+        return [(period_mean - previous) / (period - earlier).n
+                for earlier, previous in zip(self.periods, self.period_means)]
+    
+    def close_period(self):
+        """Folds the open period's mean into the trend statistics and starts a new period."""
+        if self.open_count == 0:
+            return
+        period_mean = self.open_sum / self.open_count
+        
+        less = bisect.bisect_left(self.sorted_means, period_mean)
+        greater = len(self.sorted_means) - bisect.bisect_right(self.sorted_means, period_mean)
+        self.mk_s += less - greater
+        bisect.insort(self.sorted_means, period_mean)
+        self.ties[period_mean] += 1
+        
+        slopes = self.new_slopes(self.open_period, period_mean)
+        if self.slope_sketch is None and len(self.slopes) + len(slopes) > self.max_exact_slopes:
+            self.slopes.extend(slopes)
+            self.slopes.sort()
+            self.slope_sketch = P2Quantile.from_sorted(self.slopes, 0.5)
+            self.slopes = []
+        elif self.slope_sketch is None:
+            for slope in slopes:
+                bisect.insort(self.slopes, slope)
+        else:
+            for slope in slopes:
+                self.slope_sketch.update(slope)
+        
+        self.periods.append(self.open_period)
+        self.period_means.append(period_mean)
+        self.open_period = None
+        self.open_sum = 0.0
+        self.open_count = 0
+    
+    def period_table(self):
+        """Periods and their means, including the open period last."""
+        periods = list(self.periods)
+        means = list(self.period_means)
+        if self.open_count:
+            periods.append(self.open_period)
+            means.append(self.open_sum / self.open_count)
+        return periods, means
+    
+    def sen_slope(self):
+        """Median of pairwise slopes between periods, in units per period."""
+        open_slopes = []
+        if self.open_count:
+            open_slopes = self.new_slopes(self.open_period, self.open_sum / self.open_count)
+        
+        if self.slope_sketch is not None:
+            sketch = self.slope_sketch.copy()
+            for slope in open_slopes:
+                sketch.update(slope)
+            return sketch.value()
+        
+        slopes = self.slopes + open_slopes
+        if not slopes:
+            return np.nan
+        return float(np.median(slopes))
+    
+    def sen_intercept(self):
+        """Median intercept of the Sen line, measured from the first period."""
+        slope = self.sen_slope()
+        if np.isnan(slope):
+            return np.nan
+        periods, means = self.period_table()
+        elapsed = np.array([(p - periods[0]).n for p in periods])
+        return float(np.median(np.asarray(means) - slope * elapsed))
+    
+    def mann_kendall(self):
+        """Returns the Mann-Kendall S, Z score and two-sided p-value."""
+        s = self.mk_s
+        n = len(self.period_means)
+        tie_term = sum(t * (t - 1) * (2*t + 5) for t in self.ties.values())
+        
+        if self.open_count:
+            open_mean = self.open_sum / self.open_count
+            less = bisect.bisect_left(self.sorted_means, open_mean)
+            greater = len(self.sorted_means) - bisect.bisect_right(self.sorted_means, open_mean)
+            s += less - greater
+            n += 1
+            t = self.ties[open_mean]
+            tie_term += (t + 1) * t * (2*t + 7) - t * (t - 1) * (2*t + 5)
+        
+        if n < 3:
+            return s, np.nan, np.nan
+        variance = (n * (n - 1) * (2*n + 5) - tie_term) / 18
+        if variance <= 0:
+            return s, 0.0, 1.0
+        if s > 0:
+            z = (s - 1) / math.sqrt(variance)
+        elif s < 0:
+            z = (s + 1) / math.sqrt(variance)
+        else:
+            z = 0.0
+        return s, z, math.erfc(abs(z) / math.sqrt(2))
+    
+    def summary(self, alpha=0.05):
+        s, z, p_value = self.mann_kendall()
+        if np.isnan(p_value) or p_value >= alpha:
+            trend = 'no trend'
+        else:
+            trend = 'increasing' if s > 0 else 'decreasing'
+        
+        row = {
+            'count': self.count,
+            'mean': self.mean if self.count else np.nan,
+            'std': math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan,
+            'rolling_mean': self.rolling_mean(),
+        }
+        for q, estimator in self.quantiles.items():
+            row[f'q{int(round(q * 100))}'] = estimator.value()
+        row.update({
+            'periods': len(self.period_means) + (1 if self.open_count else 0),
+            'sen_slope': self.sen_slope(),
+            'mk_s': s,
+            'mk_z': z,
+            'mk_p': p_value,
+            'trend': trend,
+        })
+        return row
+
+class TrendEngine:
+    """
+    Keeps a StreamingSeries per (station, parameter) and updates them from new readings only.
+    """
+    def __init__(self, freq='Y', window='365D', quantiles=(0.1, 0.5, 0.9), bucket='1D'):
+        self.freq = freq
+        self.window = window
+        self.quantile_levels = quantiles
+        self.bucket = bucket
+        self.series = {}
+    
+    def get_series(self, station, parameter):
+        key = (station, parameter)
+        if key not in self.series:
+            self.series[key] = StreamingSeries(self.freq, self.window, self.quantile_levels,
+                                               bucket=self.bucket)
+        return self.series[key]
+    
+    def append(self, readings):
+        """
+        Appends new readings given in long format with 'timestamp', 'station',
+        'parameter' and 'value' columns. The whole batch is validated first, so a
+        rejected batch leaves the engine unchanged.
+        """
+        readings = pd.DataFrame({
+            'timestamp': pd.to_datetime(readings['timestamp']),
+            'station': readings['station'],
+            'parameter': readings['parameter'],
+            'value': pd.to_numeric(readings['value']),
+        })
+        readings = readings[readings['value'].notna()]
+        if readings['timestamp'].isna().any():
+            raise ValueError("Readings with a value must have a timestamp; nothing was appended.")
+        readings = readings.sort_values('timestamp', kind='stable')
+        
+        # Reject the batch if any series would receive a reading older than its latest one
+        earliest = readings.groupby(['station', 'parameter'], sort=False)['timestamp'].min()
+        late = [key for key, first in earliest.items()
+                if key in self.series and self.series[key].last_time is not None
+                and first < self.series[key].last_time]
+        if late:
+            raise ValueError(f"Readings older than the latest appended reading for {late}; nothing was appended.")
+        
+        for timestamp, station, parameter, value in zip(readings['timestamp'], readings['station'],
+                                                        readings['parameter'], readings['value']):
+            self.get_series(station, parameter).update(timestamp, value)
+    
+    def summary(self, alpha=0.05):
+        rows = []
+        for (station, parameter), series in self.series.items():
+            rows.append({'station': station, 'parameter': parameter, **series.summary(alpha)})
+        return pd.DataFrame(rows)
+
+# Seed a trend engine with the yearly historical record
+def trend_engine_from_history(station='Tobol River', parameters=('DO', 'BOD', 'TN', 'TP')):
+    readings = historical_df.melt(id_vars='year', value_vars=list(parameters),
+                                  var_name='parameter', value_name='value')
+    readings['timestamp'] = pd.to_datetime(readings['year'].astype(str) + '-01-01')
+    readings['station'] = station
+    
+    engine = TrendEngine(freq='Y')
+    engine.append(readings)
+    return engine
+
+# 6. Trend dashboard refreshed from the incremental engine
+def plot_streaming_trends(engine, station='Tobol River', parameters=('DO', 'BOD', 'TN', 'TP'),
+                          filename='tobol_streaming_trends.png'):
+    fig, axes = plt.subplots(len(parameters), 1, figsize=(12, 3*len(parameters)), sharex=True)
+    axes = np.atleast_1d(axes)
+    
+    for ax, parameter in zip(axes, parameters):
+        series = engine.series.get((station, parameter))
+        if series is None or series.count == 0:
+            ax.set_title(f'{parameter}: no readings yet', fontsize=12)
+            continue
+        
+        # Only the resampled period means are drawn, never the raw history
+        periods, means = series.period_table()
+        dates = [p.to_timestamp() for p in periods]
+        ax.plot(dates, means, linewidth=2, marker='o', label=f'{parameter} period mean')
+        
+        slope = series.sen_slope()
+        if not np.isnan(slope):
+            elapsed = np.array([(p - periods[0]).n for p in periods])
+            fitted = series.sen_intercept() + slope * elapsed
+            ax.plot(dates, fitted, color='black', linestyle='--', alpha=0.7,
+                    label=f"Sen's slope {slope:+.3f}/period")
+        
+        stats = series.summary()
+        ax.set_title(f"{parameter}: {stats['trend']} (Mann-Kendall p={stats['mk_p']:.3f})", fontsize=12)
+        ax.set_ylabel(f'{parameter} (mg/L)')
+        ax.legend(loc='best', fontsize=8)
+        ax.grid(True)
+    
+    axes[-1].set_xlabel('Period')
+    fig.suptitle(f'Streaming Water Quality Trends - {station}', fontsize=16, fontweight='bold')
+    fig.tight_layout()
+    
+    save_figure(fig, filename)
+
 # Create a comprehensive dashboard with all plots
 def create_dashboard():
     fig = plt.figure(figsize=(16, 20))
@@ -464,5 +852,6 @@ if __name__ == "__main__":
     plot_pollution_sources()
     plot_ecological_status()
     plot_historical_trends()
+    plot_streaming_trends(trend_engine_from_history())
     create_dashboard()
     print("All plots have been generated successfully!")
\ No newline at end of file
@@ -0,0 +1,84 @@
+#Load generator for scenario_worker.py: measures throughput and latency percentiles
+
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+
+RESPONSE_LIMIT = 64 * 1024 * 1024
+
+def make_job(job_id, rng, outputs):
+    """
+    Random scenario around the 1.py parameters. On the default grid the worst case
+    (D=22.5, v=22, k=0.15) gives 2*alpha + beta + k*dt = 0.97, inside the stable range.
+    """
+    return {
+        'id': job_id,
+        'D': float(15.0 * rng.uniform(0.5, 1.5)),
+        'v': float(20.0 * rng.uniform(0.5, 1.1)),
+        'k': float(0.1 * rng.uniform(0.5, 1.5)),
+        'outputs': outputs,
+    }
+
+async def client(connect, jobs, latencies, errors):
+    """One connection that sends a job, waits for its result, and repeats."""
+    reader, writer = await connect()
+    try:
+        for job in jobs:
+            start = time.perf_counter()
+            writer.write((json.dumps(job) + '\n').encode())
+            await writer.drain()
+            result = json.loads(await reader.readline())
+            latencies.append(time.perf_counter() - start)
+            if result.get('status') != 'ok':
+                errors.append(result.get('error'))
+    finally:
+        writer.close()
+
+async def run_load(connect, n_jobs=200, concurrency=8, outputs=('stations',), seed=0):
+    rng = np.random.default_rng(seed)
+    jobs = [make_job(i, rng, list(outputs)) for i in range(n_jobs)]
+    latencies = []
+    errors = []
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(connect, jobs[i::concurrency], latencies, errors)
+                           for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    return {
+        'jobs': n_jobs,
+        'concurrency': concurrency,
+        'errors': len(errors),
+        'seconds': elapsed,
+        'throughput_jobs_per_s': n_jobs / elapsed,
+        'latency_ms_p50': float(np.percentile(latencies, 50)),
+        'latency_ms_p95': float(np.percentile(latencies, 95)),
+        'latency_ms_p99': float(np.percentile(latencies, 99)),
+        'latency_ms_max': float(latencies.max()),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load generator for the scenario worker.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix-socket', help='connect to a Unix socket instead of TCP')
+    parser.add_argument('--jobs', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--outputs', nargs='+', default=['stations'],
+                        choices=['stations', 'heatmap', 'time_series'])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    # Responses with figures are far larger than the default 64 KiB line limit
+    if args.unix_socket:
+        connect = lambda: asyncio.open_unix_connection(args.unix_socket, limit=RESPONSE_LIMIT)
+    else:
+        connect = lambda: asyncio.open_connection(args.host, args.port, limit=RESPONSE_LIMIT)
+
+    report = asyncio.run(run_load(connect, args.jobs, args.concurrency, args.outputs, args.seed))
+    for key, value in report.items():
+        print(f"{key:>22}: {value:.3f}" if isinstance(value, float) else f"{key:>22}: {value}")
@@ -0,0 +1,368 @@
+#Long-running scenario worker for the Tobol River transport model (1.py)
+#
+# Jobs are newline-delimited JSON objects sent over a localhost TCP port or a Unix socket:
+#   {"id": 1, "D": 15.0, "v": 20.0, "k": 0.1,
+#    "grid": {"river_length": 1400, "nx": 100, "days": 60, "nt": 120},
+#    "sources": [{"location": 280, "rate": 2.0, "start": 0, "end": 6}],
+#    "stations": [0, 200, 400], "outputs": ["stations", "heatmap", "time_series"]}
+# Every key except "id" is optional and defaults to the 1.py scenario. One JSON response
+# line is streamed back per job as soon as its batch has been solved. Invalid jobs and
+# scenarios that would be numerically unstable on their grid get an error result.
+
+import argparse
+import asyncio
+import base64
+import importlib.util
+import io
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
+import numpy as np
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '1.py')
+OUTPUTS = ('stations', 'heatmap', 'time_series')
+
+def load_model(path=MODEL_PATH):
+    """Imports 1.py once so numpy, matplotlib and the solver stay loaded between jobs."""
+    spec = importlib.util.spec_from_file_location('tobol_model', path)
+    model = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(model)
+    return model
+
+class ScenarioWorker:
+    """
+    Queues incoming jobs, groups jobs that share a grid into one batched solve and
+    keeps the most recently used grids and station operators cached between batches.
+    Jobs larger than `max_cells` (nx*nt) or with more than `max_stations` stations or
+    `max_sources` sources are rejected; a batched solve never exceeds `max_batch_cells`.
+    """
+    def __init__(self, model, batch_window=0.01, max_batch=64, max_grids=16, max_operators=256,
+                 max_cells=2_000_000, max_stations=1000, max_sources=1000, max_batch_cells=16_000_000):
+        self.model = model
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.max_cells = max_cells
+        self.max_stations = max_stations
+        self.max_sources = max_sources
+        self.max_batch_cells = max(max_batch_cells, max_cells)
+        self.queue = asyncio.Queue()
+        self.max_grids = max_grids
+        self.max_operators = max_operators
+        self.grids = OrderedDict()
+        self.operators = OrderedDict()
+
+    def get_grid(self, river_length, nx, days, nt):
+        """Returns a cached grid; arguments must already be validated by parse_job."""
+        key = (river_length, nx, days, nt)
+        if key in self.grids:
+            self.grids.move_to_end(key)
+        else:
+            self.grids[key] = {
+                'x': np.linspace(0, river_length, nx),
+                't': np.linspace(0, days, nt),
+                'dx': river_length / (nx - 1),
+                'dt': days / nt,
+            }
+            if len(self.grids) > self.max_grids:
+                self.grids.popitem(last=False)
+        return key, self.grids[key]
+
+    def get_operator(self, grid_key, grid, stations):
+        key = (grid_key, tuple(stations))
+        if key in self.operators:
+            self.operators.move_to_end(key)
+        else:
+            self.operators[key] = self.model.build_station_operator(grid['x'], stations)
+            if len(self.operators) > self.max_operators:
+                self.operators.popitem(last=False)
+        return self.operators[key]
+
+    def parse_job(self, job):
+        """Validates a job and fills in defaults from 1.py; nothing is cached for invalid jobs."""
+        model = self.model
+        grid = job.get('grid', {})
+        if not isinstance(grid, dict):
+            raise ValueError("grid must be an object")
+        river_length = finite_number(grid.get('river_length', model.river_length), 'grid.river_length')
+        days = finite_number(grid.get('days', model.days), 'grid.days')
+        nx = whole_number(grid.get('nx', model.nx), 'grid.nx')
+        nt = whole_number(grid.get('nt', model.nt), 'grid.nt')
+        if river_length <= 0 or days <= 0:
+            raise ValueError("grid.river_length and grid.days must be positive")
+        if nx < 3 or nt < 2:
+            raise ValueError("grid needs at least 3 cells and 2 time steps")
+        if nx * nt > self.max_cells:
+            raise ValueError(f"grid has {nx * nt} cells (nx*nt), more than the limit of {self.max_cells}")
+
+        D = finite_number(job.get('D', model.D), 'D')
+        v = finite_number(job.get('v', model.v), 'v')
+        k = finite_number(job.get('k', model.k), 'k')
+
+        # Reject scenarios the explicit scheme cannot solve stably on this grid
+        problem = model.stability_problem(D, v, k, river_length / (nx - 1), days / nt)
+        if problem:
+            raise ValueError(f"numerically unstable scenario: {problem}")
+
+        raw_sources = job.get('sources', [{
+            'location': float(model.x[model.input_location]),
+            'rate': model.input_rate,
+            'start': 0.0,
+            'end': model.input_duration * model.dt,
+        }])
+        if not isinstance(raw_sources, list):
+            raise ValueError("sources must be a list")
+        if len(raw_sources) > self.max_sources:
+            raise ValueError(f"{len(raw_sources)} sources, more than the limit of {self.max_sources}")
+        sources = []
+        for source in raw_sources:
+            if not isinstance(source, dict) or not {'location', 'rate', 'end'} <= source.keys():
+                raise ValueError("each source needs 'location', 'rate' and 'end'")
+            sources.append({
+                'location': finite_number(source['location'], 'source location'),
+                'rate': finite_number(source['rate'], 'source rate'),
+                'start': finite_number(source.get('start', 0.0), 'source start'),
+                'end': finite_number(source['end'], 'source end'),
+            })
+
+        stations = job.get('stations', model.station_distances)
+        if not isinstance(stations, list):
+            raise ValueError("stations must be a list")
+        if len(stations) > self.max_stations:
+            raise ValueError(f"{len(stations)} stations, more than the limit of {self.max_stations}")
+        stations = [finite_number(s, 'station') for s in stations]
+
+        outputs = job.get('outputs', ['stations'])
+        if not isinstance(outputs, list) or not all(isinstance(o, str) for o in outputs):
+            raise ValueError("outputs must be a list of names")
+        unknown = set(outputs) - set(OUTPUTS)
+        if unknown:
+            raise ValueError(f"unknown outputs: {sorted(unknown)}")
+
+        grid_key, grid_data = self.get_grid(river_length, nx, days, nt)
+        return {
+            'id': job.get('id'),
+            'D': D,
+            'v': v,
+            'k': k,
+            'grid_key': grid_key,
+            'grid': grid_data,
+            'sources': sources,
+            'stations': stations,
+            'outputs': outputs,
+        }
+
+    def evaluate_batch(self, jobs):
+        """Solves a list of raw jobs, one batched solve per distinct grid; runs in a worker thread."""
+        results = [None] * len(jobs)
+        groups = {}
+
+        for i, job in enumerate(jobs):
+            try:
+                parsed = self.parse_job(job)
+                grid = parsed['grid']
+                parsed['schedule'] = self.model.build_source_schedule(parsed['sources'], grid['x'], grid['t'],
+                                                                      grid['dx'], grid['dt'])
+            except (ValueError, TypeError, KeyError, MemoryError) as e:
+                results[i] = {'id': job.get('id'), 'status': 'error', 'error': str(e) or repr(e)}
+                continue
+            groups.setdefault(parsed['grid_key'], []).append((i, parsed))
+
+        for grid_key, members in groups.items():
+            # Split large groups so one solve stays within max_batch_cells
+            per_member = grid_key[1] * grid_key[3]
+            chunk = max(1, self.max_batch_cells // per_member)
+            for first in range(0, len(members), chunk):
+                self.solve_group(members[first:first + chunk], results)
+
+        return results
+
+    def solve_group(self, members, results):
+        """Solves jobs that share a grid in one batch and fills in their results."""
+        grid = members[0][1]['grid']
+        start = time.perf_counter()
+        try:
+            concentration = self.model.solve_1d_dar_batch([job['D'] for _, job in members],
+                                                          [job['v'] for _, job in members],
+                                                          [job['k'] for _, job in members],
+                                                          grid['x'], grid['t'], grid['dx'], grid['dt'],
+                                                          [job['schedule'] for _, job in members])
+        except (MemoryError, OverflowError) as e:
+            for i, job in members:
+                results[i] = {'id': job['id'], 'status': 'error', 'error': str(e) or repr(e)}
+            return
+        solve_time = time.perf_counter() - start
+
+        for member, (i, job) in enumerate(members):
+            try:
+                results[i] = self.render_outputs(job, grid, concentration[member])
+            except ValueError as e:
+                results[i] = {'id': job['id'], 'status': 'error', 'error': str(e)}
+                continue
+            results[i]['batch_size'] = len(members)
+            results[i]['solve_seconds'] = solve_time
+
+    def render_outputs(self, job, grid, concentration):
+        result = {'id': job['id'], 'status': 'ok'}
+
+        if 'stations' in job['outputs'] or 'time_series' in job['outputs']:
+            operator = self.get_operator(job['grid_key'], grid, job['stations'])
+            series = self.model.sample_stations(concentration, operator)
+
+        if 'stations' in job['outputs']:
+            result['t'] = grid['t'].tolist()
+            result['stations'] = {f'{distance:g}': series[:, j].tolist()
+                                  for j, distance in enumerate(job['stations'])}
+
+        figures = {}
+        if 'heatmap' in job['outputs']:
+            fig = Figure(figsize=(12, 8))
+            ax = fig.add_subplot()
+            im = ax.pcolormesh(grid['x'], grid['t'], concentration, cmap='viridis', shading='auto')
+            fig.colorbar(im, ax=ax).set_label('Pollutant concentration (mass/volume)')
+            ax.set_xlabel('Distance along river (km)')
+            ax.set_ylabel('Time (days)')
+            ax.set_title(f"D={job['D']} km²/day, v={job['v']} km/day, k={job['k']} day⁻¹")
+            figures['heatmap'] = encode_figure(fig)
+
+        if 'time_series' in job['outputs']:
+            fig = Figure(figsize=(12, 8))
+            ax = fig.add_subplot()
+            for j, distance in enumerate(job['stations']):
+                ax.plot(grid['t'], series[:, j], linewidth=2, label=f'{distance:g} km')
+            ax.set_xlabel('Time (days)')
+            ax.set_ylabel('Pollutant concentration (mass/volume)')
+            ax.legend(loc='upper right')
+            ax.grid(True)
+            figures['time_series'] = encode_figure(fig)
+
+        if figures:
+            result['figures'] = figures
+        return result
+
+    async def run_batches(self):
+        """Collects queued jobs for up to `batch_window` seconds and solves them together."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                results = await asyncio.to_thread(self.evaluate_batch, [job for job, _ in batch])
+            except Exception as e:
+                results = [{'id': job.get('id'), 'status': 'error', 'error': repr(e)} for job, _ in batch]
+
+            for (_, future), result in zip(batch, results):
+                if not future.cancelled():
+                    future.set_result(result)
+
+    async def handle_connection(self, reader, writer):
+        """Reads job lines from one client and streams back results as they complete."""
+        write_lock = asyncio.Lock()
+        pending = set()
+
+        async def respond(future, received):
+            result = await future
+            result['latency_seconds'] = time.perf_counter() - received
+            async with write_lock:
+                writer.write((json.dumps(result) + '\n').encode())
+                await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+
+                received = time.perf_counter()
+                future = asyncio.get_running_loop().create_future()
+                try:
+                    job = json.loads(line)
+                    if not isinstance(job, dict):
+                        raise ValueError("job must be a JSON object")
+                except ValueError as e:
+                    future.set_result({'id': None, 'status': 'error', 'error': f'invalid job: {e}'})
+                else:
+                    await self.queue.put((job, future))
+
+                task = asyncio.create_task(respond(future, received))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        finally:
+            writer.close()
+
+def finite_number(value, name):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f"{name} must be a finite number, got {value!r}")
+    return float(value)
+
+def whole_number(value, name):
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f"{name} must be an integer, got {value!r}")
+    return value
+
+def encode_figure(fig, dpi=100):
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=dpi, bbox_inches='tight')
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+async def serve(host='127.0.0.1', port=8765, unix_socket=None, batch_window=0.01, max_batch=64,
+                max_grids=16, max_operators=256, max_cells=2_000_000, max_batch_cells=16_000_000):
+    worker = ScenarioWorker(load_model(), batch_window=batch_window, max_batch=max_batch,
+                            max_grids=max_grids, max_operators=max_operators,
+                            max_cells=max_cells, max_batch_cells=max_batch_cells)
+    batches = asyncio.create_task(worker.run_batches())
+
+    if unix_socket:
+        server = await asyncio.start_unix_server(worker.handle_connection, path=unix_socket)
+        print(f"Scenario worker listening on {unix_socket}")
+    else:
+        server = await asyncio.start_server(worker.handle_connection, host, port)
+        print(f"Scenario worker listening on {host}:{port}")
+
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batches.cancel()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Warm scenario worker for the Tobol River transport model.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix-socket', help='listen on a Unix socket instead of TCP')
+    parser.add_argument('--batch-window', type=float, default=0.01,
+                        help='seconds to wait for more jobs before solving a batch')
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--max-grids', type=int, default=16, help='grids kept in the LRU cache')
+    parser.add_argument('--max-operators', type=int, default=256,
+                        help='station operators kept in the LRU cache')
+    parser.add_argument('--max-cells', type=int, default=2_000_000,
+                        help='largest grid (nx*nt) accepted for one job')
+    parser.add_argument('--max-batch-cells', type=int, default=16_000_000,
+                        help='largest total nx*nt across the jobs of one batched solve')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix_socket, args.batch_window, args.max_batch,
+                          args.max_grids, args.max_operators, args.max_cells, args.max_batch_cells))
+    except KeyboardInterrupt:
+        pass